@@ -1,15 +1,41 @@
 # Netlify function for MusicXML export
 import json
 
+# orjson serializes in C roughly 5-10x faster than stdlib json, which
+# matters when echoing back a large parsed MusicXML payload. Error-path
+# bodies are tiny, so those stay on stdlib json.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _dumps(obj):
+    if orjson is not None:
+        # orjson emits raw UTF-8 (it does not escape like ensure_ascii)
+        return orjson.dumps(obj).decode('utf-8')
+    return json.dumps(obj)
+
+
+# Reject oversized bodies before json.loads allocates for them; export
+# metadata payloads are well under this
+MAX_BODY = 65536
+
+# Pre-baked rejection responses: serialized once per container instead
+# of re-dumped on every bad request
+_METHOD_NOT_ALLOWED = {'statusCode': 405, 'body': '{"error": "Method not allowed"}'}
+_BODY_TOO_LARGE = {'statusCode': 413, 'body': '{"error": "Request body too large"}'}
+
+
 def handler(event, context):
     if event.get('httpMethod') != 'POST':
-        return {
-            'statusCode': 405,
-            'body': json.dumps({'error': 'Method not allowed'})
-        }
-    
+        return _METHOD_NOT_ALLOWED
+
     try:
-        data = json.loads(event.get('body', '{}'))
+        body_str = event.get('body') or '{}'
+        if len(body_str) > MAX_BODY:
+            return _BODY_TOO_LARGE
+        data = json.loads(body_str)
         
         # For now, return data for client-side conversion
         # Full implementation would use music21 library here
@@ -20,7 +46,7 @@ def handler(event, context):
             'headers': {
                 'Content-Type': 'application/json'
             },
-            'body': json.dumps({
+            'body': _dumps({
                 'message': 'Use client-side export for MusicXML files',
                 'data': data
             })
@@ -1,47 +1,349 @@
 # Netlify function to extract audio from YouTube using Python
+import collections
+import contextlib
 import json
+import mmap
+import pathlib
+import signal
 import subprocess
 import tempfile
+import threading
 import os
-import base64
 import sys
 import shutil
+import types
+from concurrent.futures import ProcessPoolExecutor
+
+# pybase64 wraps a SIMD-accelerated base64 codec (picks SSSE3/AVX2 at import
+# time); encoding multi-MB audio buffers is ~10x faster than the stdlib.
+# Fall back to stdlib base64 if it isn't installed.
+try:
+    import pybase64 as base64
+except ImportError:
+    import base64
+
+# Import yt-dlp during container init rather than per-request: it is a
+# large package whose import cost would otherwise land on the first
+# request. Warm invocations then start the download immediately.
+try:
+    import yt_dlp
+    _HAS_YTDLP_MODULE = True
+except ImportError:
+    _HAS_YTDLP_MODULE = False
+
+# Prefer tmpfs for scratch audio when available: /tmp is real disk on
+# some serverless runtimes, so writing the download there pays actual
+# I/O and pagecache churn that a RAM-backed mount avoids
+_TMPDIR = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+
+# 3-byte-aligned chunk size so every chunk except the last encodes to
+# exactly 4*N base64 bytes with no padding mid-stream
+_ENCODE_CHUNK = 3 * 65536
+
+# Wall-clock cap on a streamed yt-dlp download, matching the timeout the
+# file-based subprocess invocation always had
+_STREAM_TIMEOUT = 300
+
+# Extension -> response content type, built once per container rather
+# than as a fresh dict on each invocation
+_CONTENT_TYPES = types.MappingProxyType({
+    '.mp3': 'audio/mpeg',
+    '.m4a': 'audio/mp4',
+    '.webm': 'audio/webm',
+    '.opus': 'audio/opus',
+    '.mp4': 'audio/mp4',
+})
+
+
+def _encode_file_base64(audio_path):
+    """Stream a file through base64 in chunks.
+
+    Reading the whole file and encoding it holds raw + encoded bytes in
+    memory at once (~2.3x the file size); chunking keeps the resident
+    input at O(chunk) instead of O(file), which matters under the
+    function's memory cap for longer videos. The input is mmap'd so the
+    encoder reads the kernel pagecache directly instead of copying each
+    chunk into a userspace bytes object first, and the pages stay
+    evictable file-backed memory.
+    """
+    with open(audio_path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return ''
+        # Base64 output length is exact, so allocate it once up front:
+        # appending chunk-by-chunk would grow the bytearray geometrically
+        # with a copy at each resize
+        encoded = bytearray(((size + 2) // 3) * 4)
+        out = memoryview(encoded)
+        out_pos = 0
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            try:
+                for offset in range(0, size, _ENCODE_CHUNK):
+                    chunk = base64.b64encode(view[offset:offset + _ENCODE_CHUNK])
+                    out[out_pos:out_pos + len(chunk)] = chunk
+                    out_pos += len(chunk)
+            finally:
+                view.release()
+                out.release()
+    return encoded.decode('ascii')
+
+
+def _locate_output(audio_path):
+    """Find the file yt-dlp actually produced for this output template.
+
+    A single directory read replaces a stat per candidate extension.
+    The temp stub always exists (NamedTemporaryFile created it), so a
+    bare presence check is not enough; candidates must be non-empty,
+    which only costs a stat for actual base-name matches (at most two).
+    """
+    dirname, filename = os.path.split(audio_path)
+    base_name = filename.replace('.mp3', '')
+    produced = set(os.listdir(dirname))
+    for ext in ('.m4a', '.webm', '.opus', '.mp3', '.mp4'):
+        if base_name + ext in produced:
+            candidate = os.path.join(dirname, base_name + ext)
+            if os.path.getsize(candidate) > 0:
+                return candidate
+    return None
+
+
+def _discover_yt_dlp():
+    """Locate a runnable yt-dlp binary, or None if there isn't one.
+
+    Runs once at module load: warm containers reuse the Python process
+    across invocations, so per-request probing (which forked a
+    subprocess per candidate path) would re-pay discovery on every call
+    for an answer that never changes. os.access is a single stat rather
+    than a fork/exec round trip.
+    """
+    python_bin_dir = os.path.dirname(sys.executable)
+    candidates = [
+        os.path.join(python_bin_dir, 'yt-dlp'),  # Python environment
+        os.path.join(python_bin_dir, 'yt-dlp.exe'),  # Windows
+        '/opt/homebrew/bin/yt-dlp',  # Homebrew on Apple Silicon
+        '/usr/local/bin/yt-dlp',     # Homebrew on Intel Mac
+        shutil.which('yt-dlp'),      # System PATH (returns None if not found)
+    ]
+    for path in candidates:
+        if path and os.access(path, os.X_OK):
+            return path
+    return None
+
+
+# Resolved once per container lifetime; warm invocations pay nothing
+YT_DLP_CMD = _discover_yt_dlp()
+
+
+def _sniff_audio_ext(first_chunk):
+    """Guess the container extension from the leading bytes of a stream."""
+    if len(first_chunk) >= 8 and first_chunk[4:8] == b'ftyp':
+        return '.m4a'
+    if first_chunk[:4] == b'\x1aE\xdf\xa3':  # EBML header (webm/mkv)
+        return '.webm'
+    if first_chunk[:4] == b'OggS':
+        return '.opus'
+    if first_chunk[:3] == b'ID3' or first_chunk[:2] in (b'\xff\xfb', b'\xff\xf3', b'\xff\xf2'):
+        return '.mp3'
+    return ''
+
+
+def _download_and_encode_stream(yt_dlp_cmd, youtube_url):
+    """Pipe yt-dlp's download straight into the base64 encoder.
+
+    Download (network-bound) and encode (CPU-bound) have no dependency
+    beyond byte order, so encoding chunks as they arrive makes the
+    wall-clock roughly max(download, encode) instead of their sum, and
+    the disk round trip through a temp file disappears entirely.
+
+    Returns (audio_base64, ext); raises CalledProcessError on failure
+    and TimeoutExpired if the download exceeds _STREAM_TIMEOUT.
+    """
+    # Spool stderr to a temp file so a chatty child can never block on a
+    # full pipe while we are draining stdout
+    with tempfile.TemporaryFile() as stderr_spool:
+        # --no-part is omitted: it only skips the .part rename on file
+        # output, which stdout streaming has none of
+        proc = subprocess.Popen([
+            yt_dlp_cmd,
+            '-f', 'bestaudio[ext=m4a]/bestaudio[ext=webm]/bestaudio',
+            '-N', '4',  # Parallel fragment downloads for HLS/DASH
+            '--no-progress',
+            '--buffer-size', '16K',
+            '-o', '-',
+            youtube_url
+        ], stdout=subprocess.PIPE, stderr=stderr_spool, start_new_session=True)
+
+        # A stalled child blocks read() indefinitely, so the deadline is
+        # enforced by a watchdog that kills the whole process group (any
+        # grandchild could be holding the pipe open): the read then
+        # returns EOF and the timeout is reported below
+        timed_out = threading.Event()
+
+        def _kill_on_timeout():
+            timed_out.set()
+            with contextlib.suppress(OSError):
+                os.killpg(proc.pid, signal.SIGKILL)
+
+        watchdog = threading.Timer(_STREAM_TIMEOUT, _kill_on_timeout)
+        watchdog.start()
+
+        encoded = bytearray()
+        ext = None
+        carry = b''  # held-back remainder so every encode input is 3-aligned
+        try:
+            while True:
+                chunk = proc.stdout.read(_ENCODE_CHUNK)
+                if not chunk:
+                    break
+                if ext is None:
+                    ext = _sniff_audio_ext(chunk)
+                chunk = carry + chunk
+                usable = len(chunk) - (len(chunk) % 3)
+                encoded += base64.b64encode(chunk[:usable])
+                carry = chunk[usable:]
+            if carry:
+                encoded += base64.b64encode(carry)
+        finally:
+            watchdog.cancel()
+            proc.stdout.close()
+
+        returncode = proc.wait()
+        if timed_out.is_set():
+            raise subprocess.TimeoutExpired(yt_dlp_cmd, _STREAM_TIMEOUT)
+        if returncode != 0 or not encoded:
+            stderr_spool.seek(0)
+            raise subprocess.CalledProcessError(
+                returncode or 1, yt_dlp_cmd, stderr=stderr_spool.read())
+
+    return encoded.decode('ascii'), ext or '.m4a'
+
+
+# Presigned URLs expire after this many seconds
+_PRESIGN_EXPIRES = 3600
+
+# The request body only ever carries a videoId; reject anything larger
+# before json.loads allocates for it
+MAX_BODY = 256
+
+# Encode files above this size in a worker process so the handler can
+# assemble the rest of the response while the codec runs
+_ENCODE_OFFLOAD_THRESHOLD = 2 * 1024 * 1024
+
+# Single-worker pool for large-file encodes. The executor spawns its
+# worker lazily on first submit, so prime it with a no-op here to move
+# the fork into container init instead of the first large request. The
+# submit side passes only the file path, but the encoded result (4/3x
+# the file size) still comes back through the pickled result queue.
+try:
+    _POOL = ProcessPoolExecutor(max_workers=1)
+    _POOL.submit(int)  # warmup: forks the worker during container init
+except OSError:
+    _POOL = None
+
+
+# Warm containers keep module state between invocations, so memoize the
+# finished (already base64'd) response per videoId: UI retries, shared
+# links and pagination re-request the same video, and a hit skips the
+# whole download + encode pipeline. LRU-evicted by total body bytes.
+_AUDIO_CACHE = collections.OrderedDict()  # video_id -> (response, size)
+_AUDIO_CACHE_BYTES = 0
+_AUDIO_CACHE_MAX_BYTES = 100 * 1024 * 1024
+
+
+def _cache_get(video_id):
+    cached = _AUDIO_CACHE.get(video_id)
+    if cached is None:
+        return None
+    _AUDIO_CACHE.move_to_end(video_id)
+    return cached[0]
+
+
+def _cache_put(video_id, response):
+    global _AUDIO_CACHE_BYTES
+    size = len(response['body'])
+    if size > _AUDIO_CACHE_MAX_BYTES:
+        return
+    if video_id in _AUDIO_CACHE:
+        _AUDIO_CACHE_BYTES -= _AUDIO_CACHE.pop(video_id)[1]
+    while _AUDIO_CACHE and _AUDIO_CACHE_BYTES + size > _AUDIO_CACHE_MAX_BYTES:
+        _, (_, evicted_size) = _AUDIO_CACHE.popitem(last=False)
+        _AUDIO_CACHE_BYTES -= evicted_size
+    _AUDIO_CACHE[video_id] = (response, size)
+    _AUDIO_CACHE_BYTES += size
+
+
+# Pre-baked rejection responses: serialized once per container instead
+# of re-dumped on every bad request (pre-warm pings hit these paths)
+_METHOD_NOT_ALLOWED = {'statusCode': 405, 'body': '{"error": "Method not allowed"}'}
+_BODY_TOO_LARGE = {'statusCode': 413, 'body': '{"error": "Request body too large"}'}
+_VIDEO_ID_REQUIRED = {'statusCode': 400, 'body': '{"error": "Video ID required"}'}
+
+
+def _upload_and_presign(audio_path, video_id, ext, content_type):
+    """Upload the audio to S3 and return a presigned download URL.
+
+    The cheapest base64 is no base64: handing the client a direct URL
+    avoids a full encoding pass and the 4/3x payload inflation of a
+    base64 JSON body. Requires the AUDIO_BUCKET env var (and boto3);
+    returns None when unconfigured or on upload failure so the caller
+    can fall back to the inline base64 response.
+    """
+    bucket = os.environ.get('AUDIO_BUCKET')
+    if not bucket:
+        return None
+    try:
+        import boto3
+    except ImportError:
+        return None
+    try:
+        key = f'audio/{video_id}{ext}'
+        s3 = boto3.client('s3')
+        s3.upload_file(audio_path, bucket, key,
+                       ExtraArgs={'ContentType': content_type})
+        return s3.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': bucket, 'Key': key},
+            ExpiresIn=_PRESIGN_EXPIRES,
+        )
+    except Exception:
+        return None
 
 def handler(event, context):
     if event.get('httpMethod') != 'POST':
-        return {
-            'statusCode': 405,
-            'body': json.dumps({'error': 'Method not allowed'})
-        }
-    
+        return _METHOD_NOT_ALLOWED
+
     try:
-        body = json.loads(event.get('body', '{}'))
+        body_str = event.get('body') or '{}'
+        if len(body_str) > MAX_BODY:
+            return _BODY_TOO_LARGE
+        body = json.loads(body_str)
         video_id = body.get('videoId')
-        
+
         if not video_id:
-            return {
-                'statusCode': 400,
-                'body': json.dumps({'error': 'Video ID required'})
-            }
+            return _VIDEO_ID_REQUIRED
+
+        # Repeat hit in a warm container: ~microseconds vs ~seconds
+        cached = _cache_get(video_id)
+        if cached is not None:
+            return cached
         
         # Extract YouTube URL
         youtube_url = f'https://www.youtube.com/watch?v={video_id}'
         
-        # Create temporary file for audio
-        with tempfile.NamedTemporaryFile(suffix='.mp3', delete=False) as tmp_file:
+        # Create temporary file for audio (tmpfs-backed where possible)
+        with tempfile.NamedTemporaryFile(suffix='.mp3', dir=_TMPDIR, delete=False) as tmp_file:
             audio_path = tmp_file.name
-        
+
+        # Track the original stub and whether the output was located, so
+        # cleanup can unlink exact paths instead of stat-polling candidates
+        tmp_stub = audio_path
+        file_located = False
+
         try:
             # Prioritize using yt-dlp as Python module (works reliably in Netlify/serverless)
             # This is what gets installed from requirements.txt
-            use_module = False
-            try:
-                import yt_dlp
-                use_module = True
-            except ImportError:
-                pass
-            
-            if use_module:
+            if _HAS_YTDLP_MODULE:
                 # Use yt-dlp as Python module (preferred for serverless environments)
                 # Download best audio format directly (no FFmpeg needed)
                 try:
@@ -50,26 +352,24 @@ def handler(event, context):
                         'outtmpl': audio_path.replace('.mp3', '.%(ext)s'),
                         'quiet': True,
                         'no_warnings': True,
+                        # Fetch HLS/DASH fragments in parallel; progress
+                        # callbacks are pure overhead here
+                        'concurrent_fragment_downloads': 4,
+                        'noprogress': True,
                     }
                     
                     with yt_dlp.YoutubeDL(ydl_opts) as ydl:
                         ydl.download([youtube_url])
                     
                     # Find the actual output file (yt-dlp may add extension)
-                    if not os.path.exists(audio_path):
-                        # Look for files with similar name
-                        base_name = audio_path.replace('.mp3', '')
-                        for ext in ['.m4a', '.webm', '.opus', '.mp3', '.mp4']:
-                            candidate = base_name + ext
-                            if os.path.exists(candidate):
-                                audio_path = candidate
-                                break
-                    
-                    if not os.path.exists(audio_path):
+                    located = _locate_output(audio_path)
+                    if located is None:
                         return {
                             'statusCode': 500,
                             'body': json.dumps({'error': 'Failed to extract audio file'})
                         }
+                    audio_path = located
+                    file_located = True
                 except Exception as e:
                     return {
                         'statusCode': 500,
@@ -79,37 +379,10 @@ def handler(event, context):
                         })
                     }
             else:
-                # Fallback: Try to find yt-dlp binary (for local development)
-                python_bin_dir = os.path.dirname(sys.executable)
-                yt_dlp_paths = [
-                    os.path.join(python_bin_dir, 'yt-dlp'),  # Python environment
-                    os.path.join(python_bin_dir, 'yt-dlp.exe'),  # Windows
-                    '/opt/homebrew/bin/yt-dlp',  # Homebrew on Apple Silicon
-                    '/usr/local/bin/yt-dlp',     # Homebrew on Intel Mac
-                    shutil.which('yt-dlp'),      # System PATH (returns None if not found)
-                    'yt-dlp',                    # Fallback: try direct command
-                ]
-                
-                # Filter out None values
-                yt_dlp_paths = [p for p in yt_dlp_paths if p]
-                
-                yt_dlp_cmd = None
-                for path in yt_dlp_paths:
-                    if path == 'yt-dlp' or os.path.exists(path):
-                        # Test if command works
-                        try:
-                            test_result = subprocess.run(
-                                [path, '--version'],
-                                capture_output=True,
-                                timeout=5,
-                                text=True
-                            )
-                            if test_result.returncode == 0:
-                                yt_dlp_cmd = path
-                                break
-                        except (subprocess.TimeoutExpired, FileNotFoundError, OSError):
-                            continue
-                
+                # Fallback: yt-dlp binary discovered at module load
+                # (for local development)
+                yt_dlp_cmd = YT_DLP_CMD
+
                 if not yt_dlp_cmd:
                     return {
                         'statusCode': 500,
@@ -119,59 +392,82 @@ def handler(event, context):
                         })
                     }
                 
-                # Use yt-dlp command-line tool
-                result = subprocess.run([
-                    yt_dlp_cmd,
-                    '-x',  # Extract audio
-                    '--audio-format', 'mp3',
-                    '--audio-quality', '0',  # Best quality
-                    '-o', audio_path,
-                    youtube_url
-                ], check=True, capture_output=True, text=True, timeout=300)
-            
-            # Read audio file
-            with open(audio_path, 'rb') as f:
-                audio_data = f.read()
-            
+                # Use yt-dlp command-line tool, streaming the native
+                # bestaudio download straight through the encoder instead of
+                # going via a temp file: overlaps network and CPU, and the
+                # container is sniffed from the first chunk's magic bytes
+                audio_base64, ext = _download_and_encode_stream(yt_dlp_cmd, youtube_url)
+
+                response = {
+                    'statusCode': 200,
+                    'headers': {
+                        'Content-Type': _CONTENT_TYPES.get(ext, 'audio/mpeg'),
+                        'Content-Disposition': f'attachment; filename="audio_{video_id}{ext}"'
+                    },
+                    'body': audio_base64,
+                    'isBase64Encoded': True
+                }
+                _cache_put(video_id, response)
+                return response
+
             # Determine content type based on file extension
             ext = os.path.splitext(audio_path)[1].lower()
-            content_types = {
-                '.mp3': 'audio/mpeg',
-                '.m4a': 'audio/mp4',
-                '.webm': 'audio/webm',
-                '.opus': 'audio/opus',
-                '.mp4': 'audio/mp4',
-            }
-            content_type = content_types.get(ext, 'audio/mpeg')
-            
-            # Convert to base64 for transmission
-            audio_base64 = base64.b64encode(audio_data).decode('utf-8')
-            
-            return {
+            content_type = _CONTENT_TYPES.get(ext, 'audio/mpeg')
+
+            # Prefer handing back a direct download URL: no encoding pass,
+            # no 4/3x base64 bandwidth tax on the response body
+            presigned_url = _upload_and_presign(audio_path, video_id, ext, content_type)
+            if presigned_url:
+                return {
+                    'statusCode': 200,
+                    'headers': {
+                        'Content-Type': 'application/json'
+                    },
+                    'body': json.dumps({
+                        'url': presigned_url,
+                        'expires': _PRESIGN_EXPIRES
+                    })
+                }
+
+            # Convert to base64 for transmission, streaming from disk so the
+            # raw audio is never fully resident alongside its encoding.
+            # Large files encode in the worker process, overlapping with
+            # response assembly here; the worker reads the path itself.
+            encode_future = None
+            if _POOL is not None and os.path.getsize(audio_path) > _ENCODE_OFFLOAD_THRESHOLD:
+                encode_future = _POOL.submit(_encode_file_base64, audio_path)
+
+            response = {
                 'statusCode': 200,
                 'headers': {
                     'Content-Type': content_type,
                     'Content-Disposition': f'attachment; filename="audio_{video_id}{ext}"'
                 },
-                'body': audio_base64,
                 'isBase64Encoded': True
             }
+            response['body'] = (encode_future.result() if encode_future is not None
+                                else _encode_file_base64(audio_path))
+            _cache_put(video_id, response)
+            return response
         finally:
-            # Clean up temporary file(s)
-            if os.path.exists(audio_path):
+            # Clean up the located output and the original stub (distinct
+            # paths when the download picked a non-mp3 container) with
+            # direct unlinks -- no candidate-extension stat polling
+            with contextlib.suppress(OSError):
                 os.unlink(audio_path)
-            # Also clean up any files with different extensions from the same base name
-            base_name = os.path.splitext(audio_path)[0]
-            for ext in ['.m4a', '.webm', '.opus', '.mp3', '.mp4']:
-                candidate = base_name + ext
-                if os.path.exists(candidate) and candidate != audio_path:
-                    try:
-                        os.unlink(candidate)
-                    except OSError:
-                        pass
+            if audio_path != tmp_stub:
+                with contextlib.suppress(OSError):
+                    os.unlink(tmp_stub)
+            if not file_located:
+                # Partial failure: sweep anything sharing the base name
+                # (one directory read instead of a stat per extension)
+                stub = pathlib.Path(tmp_stub)
+                for leftover in stub.parent.glob(stub.stem + '.*'):
+                    with contextlib.suppress(OSError):
+                        leftover.unlink()
                 
     except subprocess.CalledProcessError as e:
-        error_output = e.stderr if hasattr(e, 'stderr') else str(e)
+        error_output = e.stderr.decode('utf-8', 'replace') if e.stderr else ''
         return {
             'statusCode': 500,
             'body': json.dumps({